@@ -1,16 +1,35 @@
 import streamlit as st
 import json
+import csv
+import io
+import logging
 import os
-import pandas as pd
 from datetime import datetime
 import hashlib
-import yaml
-from yaml.loader import SafeLoader
-from fpdf import FPDF
+import hmac
+import re
+import threading
+import uuid
+from functools import lru_cache
+
+# Log records are (de)serialized with orjson when it is installed
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+
+logger = logging.getLogger(__name__)
 
 # Configuration files
-DATA_FILE = "qa_data.json"
-USER_FILE = "users.yaml"
+DATA_FILE = "qa_data.jsonl"
+LEGACY_DATA_FILE = "qa_data.json"
+USER_FILE = "users.json"
+LEGACY_USER_FILE = "users.yaml"
+MIN_PASSWORD_LENGTH = 6
 
 # Initialize session state
 if "subjects" not in st.session_state:
@@ -22,77 +41,226 @@ if "current_user" not in st.session_state:
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
 
-# Load existing data
-def load_data():
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    return {}
+# File modification time, used as the cache key for the loaders below
+def file_mtime(path):
+    if os.path.exists(path):
+        return os.path.getmtime(path)
+    return 0.0
+
+# Apply one log record to the in-memory {user: {subject: {id: qa}}} view
+def apply_record(data, rec):
+    subjects = data.setdefault(rec["user"], {})
+    subject = rec["subject"]
+    if rec["op"] == "add":
+        subjects.setdefault(subject, {})[rec["id"]] = rec["qa"]
+    elif rec["op"] == "edit":
+        # Never resurrect an entry that was deleted before the edit landed
+        if rec["id"] in subjects.get(subject, {}):
+            subjects[subject][rec["id"]] = rec["qa"]
+    elif rec["op"] == "del" and subject in subjects:
+        subjects[subject].pop(rec["id"], None)
+        if not subjects[subject]:
+            del subjects[subject]
+
+# Encode the current data as one "add" record per Q&A
+def snapshot_records(data):
+    lines = []
+    for user, subjects in data.items():
+        for subject, entries in subjects.items():
+            for qa in entries.values():
+                rec = {
+                    "op": "add",
+                    "subject": subject,
+                    "id": qa["id"],
+                    "qa": qa,
+                    "user": user,
+                    "ts": qa.get("timestamp")
+                }
+                lines.append(json_dumps(rec) + b"\n")
+    return b"".join(lines)
+
+# Process-wide lock serializing file writes from concurrent sessions
+@st.cache_resource
+def save_lock():
+    return threading.Lock()
+
+# Write through a temp file so readers never see a partial file
+def write_atomic(path, content):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+# Load existing data by replaying the log (cached until the file changes)
+@st.cache_data(show_spinner=False)
+def load_data(mtime):
+    data = {}
+    if not os.path.exists(DATA_FILE):
+        return data
+    # Bytes of the record currently backing each live Q&A
+    live_sizes = {}
+    with open(DATA_FILE, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rec = json_loads(line)
+            except ValueError:
+                # Torn write from an interrupted append; compaction drops it
+                logger.warning("Skipping malformed record in %s: %r", DATA_FILE, line[:80])
+                continue
+            apply_record(data, rec)
+            if rec["id"] in data.get(rec["user"], {}).get(rec["subject"], {}):
+                live_sizes[rec["id"]] = len(line.rstrip(b"\n")) + 1
+            else:
+                live_sizes.pop(rec["id"], None)
+        replayed = f.tell()
+    
+    # Compact once edits and deletes make the log twice the live size
+    if replayed > 2 * sum(live_sizes.values()):
+        with save_lock():
+            # Skip if anything was appended after the replay; mtimes can be
+            # too coarse to notice, so compare the byte count as well
+            if os.path.getsize(DATA_FILE) == replayed and os.path.getmtime(DATA_FILE) == mtime:
+                write_atomic(DATA_FILE, snapshot_records(data))
+    return data
+
+# Drop every cache derived from the log after it changes
+def clear_data_caches():
+    load_data.clear()
+    load_user_data.clear()
+    build_search_index.clear()
 
-# Save data to file
+# Rewrite the whole log from the given data
 def save_data(data):
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    with save_lock():
+        write_atomic(DATA_FILE, snapshot_records(data))
+    clear_data_caches()
 
-# Initialize or load data
-st.session_state.subjects = load_data()
+# Append a single change to the log
+def append_record(op, subject, qa_id, qa=None):
+    rec = {
+        "op": op,
+        "subject": subject,
+        "id": qa_id,
+        "qa": qa,
+        "user": st.session_state.current_user,
+        "ts": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    with save_lock():
+        with open(DATA_FILE, "a+b") as f:
+            # Start on a fresh line if a previous append was cut short
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(json_dumps(rec) + b"\n")
+    clear_data_caches()
+
+# One-shot migration of the old single-document JSON store to the log
+def migrate_legacy_data():
+    if not os.path.exists(LEGACY_DATA_FILE) or os.path.exists(DATA_FILE):
+        return
+    with open(LEGACY_DATA_FILE, "r") as f:
+        legacy = json.load(f)
+    data = {}
+    for subject, qa_list in legacy.items():
+        for qa in qa_list:
+            qa["id"] = uuid.uuid4().hex
+            subjects = data.setdefault(qa.get("created_by"), {})
+            subjects.setdefault(subject, {})[qa["id"]] = qa
+    save_data(data)
+    os.rename(LEGACY_DATA_FILE, LEGACY_DATA_FILE + ".bak")
 
 # User management functions
+# Repeat hashes of the same password are served from a small in-process
+# cache; it lives only in this process's memory and is gone on restart
+@lru_cache(maxsize=256)
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
-def load_users():
+# Read the user store straight from disk
+def read_users():
     if os.path.exists(USER_FILE):
         with open(USER_FILE, "r") as f:
-            return yaml.safe_load(f) or {}
+            return json.load(f)
     return {}
 
+@st.cache_data(show_spinner=False)
+def load_users(mtime):
+    return read_users()
+
+# Callers must hold save_lock()
+def write_users(users):
+    write_atomic(USER_FILE, json.dumps(users, indent=4).encode())
+    load_users.clear()
+
 def save_users(users):
-    with open(USER_FILE, "w") as f:
-        yaml.dump(users, f)
+    with save_lock():
+        write_users(users)
 
-def register_user(username, password, email=None):
-    users = load_users()
-    if username in users:
-        return False
-    users[username] = {
-        "password": hash_password(password),
-        "email": email,
-        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
+# One-shot migration of the old YAML user store to JSON
+def migrate_legacy_users():
+    if not os.path.exists(LEGACY_USER_FILE) or os.path.exists(USER_FILE):
+        return
+    import yaml
+    with open(LEGACY_USER_FILE, "r") as f:
+        users = yaml.safe_load(f) or {}
     save_users(users)
+    os.rename(LEGACY_USER_FILE, LEGACY_USER_FILE + ".bak")
+
+# Returns False if the username is taken; raises ValueError for a short password
+def register_user(username, password, email=None):
+    if len(password) < MIN_PASSWORD_LENGTH:
+        raise ValueError(f"Password must be at least {MIN_PASSWORD_LENGTH} characters")
+    # Read-modify-write under the lock so concurrent sign-ups don't drop users
+    with save_lock():
+        users = read_users()
+        if username in users:
+            return False
+        users[username] = {
+            "password": hash_password(password),
+            "email": email,
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        write_users(users)
     return True
 
 def verify_user(username, password):
-    users = load_users()
-    if username in users:
-        return users[username]["password"] == hash_password(password)
-    return False
+    users = load_users(file_mtime(USER_FILE))
+    record = users.get(username)
+    if record is None:
+        return False
+    return hmac.compare_digest(record["password"], hash_password(password))
 
-# PDF Generation
+# PDF Generation (cached briefly, so re-exporting the same selection is free
+# without keeping users' private Q&As in memory indefinitely)
+@st.cache_data(show_spinner=False, max_entries=16, ttl=600)
 def generate_pdf(data, username):
+    # Imported here so pages that never export don't pay for fpdf2
+    from fpdf import FPDF
+    
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=15)
     pdf.add_page()
-    pdf.set_font("Arial", size=12)
+    pdf.set_font("helvetica", size=12)
     
     pdf.cell(200, 10, txt=f"Q&A Export for {username}", ln=True, align='C')
     pdf.ln(10)
     
     for subject, qa_list in data.items():
-        pdf.set_font("Arial", 'B', size=12)
+        pdf.set_font("helvetica", 'B', size=12)
         pdf.cell(200, 10, txt=subject, ln=True)
-        pdf.set_font("Arial", size=11)
+        pdf.set_font("helvetica", size=11)
         
+        # One multi_cell per entry instead of one call per line
         for qa in qa_list:
-            pdf.multi_cell(0, 10, txt=f"Q: {qa['question']}")
-            pdf.multi_cell(0, 10, txt=f"A: {qa['answer']}")
-            pdf.cell(0, 10, txt=f"Date: {qa['timestamp']}", ln=True)
+            text = f"Q: {qa['question']}\nA: {qa['answer']}\nDate: {qa['timestamp']}"
+            pdf.multi_cell(0, 10, txt=text)
             pdf.ln(5)
     
-    pdf_file = f"qna_export_{username}.pdf"
-    pdf.output(pdf_file)
-    return pdf_file
+    # fpdf2 returns the document bytes when no file name is given
+    return bytes(pdf.output())
 
 # Authentication system
 def authentication_section():
@@ -122,26 +290,61 @@ def authentication_section():
             if st.form_submit_button("Register"):
                 if new_password != confirm_password:
                     st.error("Passwords don't match!")
-                elif len(new_password) < 6:
-                    st.error("Password must be at least 6 characters")
                 else:
-                    if register_user(new_username, new_password, email):
-                        st.success("Registration successful! Please login.")
+                    try:
+                        registered = register_user(new_username, new_password, email)
+                    except ValueError as e:
+                        st.error(str(e))
                     else:
-                        st.error("Username already exists")
+                        if registered:
+                            st.success("Registration successful! Please login.")
+                        else:
+                            st.error("Username already exists")
 
-# Filter data by current user
+# Data of the current user
 def get_user_data():
-    all_data = st.session_state.subjects
-    user_data = {}
-    for subject, qa_list in all_data.items():
-        user_qa = [qa for qa in qa_list if qa.get("created_by") == st.session_state.current_user]
-        if user_qa:
-            user_data[subject] = user_qa
-    return user_data
+    return st.session_state.subjects
+
+# One user's {subject: {id: qa}} slice (cached until the data changes), so a
+# rerun copies only that user's Q&As out of the cache
+@st.cache_data(show_spinner=False, max_entries=100)
+def load_user_data(user, mtime):
+    return load_data(mtime).get(user, {})
+
+# Case-insensitive literal pattern for a search term
+@lru_cache(maxsize=64)
+def compile_search(term):
+    return re.compile(re.escape(term), re.IGNORECASE)
+
+# Search index of one user's Q&As (cached until the data changes);
+# bounded to roughly twice the number of concurrently active users
+@st.cache_data(show_spinner=False, max_entries=100)
+def build_search_index(user, mtime):
+    import pandas as pd
+    
+    # Built column by column; pandas is much slower with a list of row dicts
+    cols = {"Subject": [], "Question": [], "Answer": [], "Date": []}
+    for subject, entries in load_user_data(user, mtime).items():
+        for qa in entries.values():
+            cols["Subject"].append(subject)
+            cols["Question"].append(qa["question"])
+            cols["Answer"].append(qa["answer"])
+            cols["Date"].append(qa["timestamp"])
+    df = pd.DataFrame(cols, dtype=object, copy=False)
+    # Few distinct subjects, many rows: store each name once
+    df["Subject"] = df["Subject"].astype("category")
+    return df
+
+# Reset the Add Q&A inputs (runs as a button callback, before the rerun)
+def clear_qa_inputs():
+    st.session_state["subject_input"] = ""
+    st.session_state["question_input"] = ""
+    st.session_state["answer_input"] = ""
 
 # Main app function
 def main_app():
+    st.session_state.subjects = load_user_data(st.session_state.current_user, file_mtime(DATA_FILE))
+    
     st.title("📚 Private Q&A Knowledge Base")
     st.write(f"Welcome, {st.session_state.current_user}!")
     
@@ -155,6 +358,7 @@ def main_app():
         st.rerun()
 
     # Add Q&A Section
+    @st.fragment
     def add_qa():
         st.subheader("Add New Question & Answer")
         
@@ -168,24 +372,26 @@ def main_app():
                 if not subject or not question or not answer:
                     st.error("Please fill in all fields!")
                 else:
-                    if subject not in st.session_state.subjects:
-                        st.session_state.subjects[subject] = []
+                    user_data = get_user_data()
+                    if subject not in user_data:
+                        user_data[subject] = {}
                     
                     new_entry = {
+                        "id": uuid.uuid4().hex,
                         "question": question,
                         "answer": answer,
                         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                         "created_by": st.session_state.current_user
                     }
-                    st.session_state.subjects[subject].append(new_entry)
-                    save_data(st.session_state.subjects)
+                    user_data[subject][new_entry["id"]] = new_entry
+                    append_record("add", subject, new_entry["id"], qa=new_entry)
                     st.success("✅ Q&A saved successfully!")
                     st.balloons()
         with col2:
-            if st.button("Clear Fields"):
-                st.rerun()
+            st.button("Clear Fields", on_click=clear_qa_inputs)
 
     # View Q&As Section with editing
+    @st.fragment
     def view_qa():
         st.subheader("My Q&As")
         
@@ -201,9 +407,9 @@ def main_app():
         )
         
         st.markdown(f"### 📌 {selected_subject}")
-        qa_list = user_data[selected_subject]
+        entries = user_data[selected_subject]
         
-        for i, qa in enumerate(qa_list, 1):
+        for i, qa in enumerate(entries.values(), 1):
             with st.expander(f"Q{i}: {qa['question'][:50]}..."):
                 st.markdown("#### ❓ Question:")
                 st.write(qa["question"])
@@ -219,22 +425,19 @@ def main_app():
                     if st.button(f"✏ Edit Q{i}", key=f"edit_{i}"):
                         st.session_state.editing = {
                             "subject": selected_subject,
-                            "index": i-1,
+                            "id": qa["id"],
                             "question": qa["question"],
                             "answer": qa["answer"]
                         }
                 with col2:
                     if st.button(f"🗑 Delete Q{i}", key=f"delete_{i}"):
-                        # Find the actual index in the full dataset
-                        full_qa_list = st.session_state.subjects[selected_subject]
-                        for idx, item in enumerate(full_qa_list):
-                            if (item["question"] == qa["question"] and 
-                                item["answer"] == qa["answer"] and
-                                item.get("created_by") == st.session_state.current_user):
-                                del st.session_state.subjects[selected_subject][idx]
-                                save_data(st.session_state.subjects)
-                                st.rerun()
-                                break
+                        entries.pop(qa["id"])
+                        if not entries:
+                            del user_data[selected_subject]
+                        append_record("del", selected_subject, qa["id"])
+                        if st.session_state.get("editing", {}).get("id") == qa["id"]:
+                            del st.session_state.editing
+                        st.rerun()
         
         # Edit modal
         if "editing" in st.session_state:
@@ -254,54 +457,46 @@ def main_app():
                 
                 if st.form_submit_button("Save Changes"):
                     subject = st.session_state.editing["subject"]
-                    # Find the actual index in the full dataset
-                    full_qa_list = st.session_state.subjects[subject]
-                    for idx, item in enumerate(full_qa_list):
-                        if (item["question"] == st.session_state.editing["question"] and 
-                            item["answer"] == st.session_state.editing["answer"] and
-                            item.get("created_by") == st.session_state.current_user):
-                            full_qa_list[idx]["question"] = new_question
-                            full_qa_list[idx]["answer"] = new_answer
-                            full_qa_list[idx]["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            save_data(st.session_state.subjects)
-                            break
-                    
+                    qa_id = st.session_state.editing["id"]
+                    # Check the log, not this session's copy: another session may
+                    # have deleted the entry since this page was loaded
+                    fresh = load_user_data(st.session_state.current_user, file_mtime(DATA_FILE))
+                    item = fresh.get(subject, {}).get(qa_id)
                     del st.session_state.editing
-                    st.rerun()
+                    if item is None:
+                        st.warning("This Q&A no longer exists.")
+                    else:
+                        item["question"] = new_question
+                        item["answer"] = new_answer
+                        item["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        append_record("edit", subject, qa_id, qa=item)
+                        st.rerun()
                 
                 if st.form_submit_button("Cancel"):
                     del st.session_state.editing
                     st.rerun()
 
     # Search functionality (user-specific)
+    @st.fragment
     def search_qa():
         st.subheader("🔍 Search My Q&As")
         search_term = st.text_input("Enter search term")
         
         if search_term:
-            user_data = get_user_data()
-            results = []
-            for subject, qa_list in user_data.items():
-                for qa in qa_list:
-                    if (search_term.lower() in qa["question"].lower() or 
-                        search_term.lower() in qa["answer"].lower()):
-                        results.append({
-                            "Subject": subject,
-                            "Question": qa["question"],
-                            "Answer": qa["answer"],
-                            "Date": qa["timestamp"]
-                        })
+            index = build_search_index(st.session_state.current_user, file_mtime(DATA_FILE))
+            pattern = compile_search(search_term)
+            mask = index["Question"].str.contains(pattern) | index["Answer"].str.contains(pattern)
             
-            if results:
-                st.write(f"Found {len(results)} results:")
-                df = pd.DataFrame(results)
+            if mask.any():
+                df = index[mask]
+                st.write(f"Found {len(df)} results:")
                 st.dataframe(df, hide_index=True, use_container_width=True)
                 
                 # Export search results
-                csv = df.to_csv(index=False)
+                csv_data = df.to_csv(index=False)
                 st.download_button(
                     "Download Search Results as CSV",
-                    data=csv,
+                    data=csv_data,
                     file_name="my_search_results.csv",
                     mime="text/csv"
                 )
@@ -309,6 +504,7 @@ def main_app():
                 st.info("No matching Q&As found in your collection.")
 
     # Export functionality (user-specific)
+    @st.fragment
     def export_qa():
         st.subheader("📤 Export My Q&As")
         
@@ -329,29 +525,24 @@ def main_app():
             return
         
         if st.button("Generate Export"):
-            export_data = {subj: user_data[subj] for subj in selected_subjects}
+            export_data = {subj: list(user_data[subj].values()) for subj in selected_subjects}
             
             if export_format == "CSV":
-                data = []
+                buf = io.StringIO()
+                writer = csv.writer(buf, lineterminator="\n")
+                writer.writerow(["Subject", "Question", "Answer", "Date"])
                 for subject, qa_list in export_data.items():
                     for qa in qa_list:
-                        data.append({
-                            "Subject": subject,
-                            "Question": qa["question"],
-                            "Answer": qa["answer"],
-                            "Date": qa["timestamp"]
-                        })
-                df = pd.DataFrame(data)
-                csv = df.to_csv(index=False)
+                        writer.writerow([subject, qa["question"], qa["answer"], qa["timestamp"]])
                 st.download_button(
                     "Download CSV",
-                    data=csv,
+                    data=buf.getvalue(),
                     file_name=f"my_qna_export_{st.session_state.current_user}.csv",
                     mime="text/csv"
                 )
             
             elif export_format == "JSON":
-                json_str = json.dumps(export_data, indent=4)
+                json_str = json.dumps(export_data, separators=(",", ":"))
                 st.download_button(
                     "Download JSON",
                     data=json_str,
@@ -360,28 +551,26 @@ def main_app():
                 )
             
             elif export_format == "PDF":
-                pdf_file = generate_pdf(export_data, st.session_state.current_user)
-                with open(pdf_file, "rb") as f:
-                    pdf_bytes = f.read()
+                pdf_bytes = generate_pdf(export_data, st.session_state.current_user)
                 st.download_button(
                     "Download PDF",
                     data=pdf_bytes,
                     file_name=f"my_qna_export_{st.session_state.current_user}.pdf",
                     mime="application/pdf"
                 )
-                os.remove(pdf_file)  # Clean up
             
             elif export_format == "Markdown":
-                md_content = f"# Q&A Export for {st.session_state.current_user}\n\n"
+                buf = io.StringIO()
+                buf.write(f"# Q&A Export for {st.session_state.current_user}\n\n")
                 for subject, qa_list in export_data.items():
-                    md_content += f"## {subject}\n\n"
+                    buf.write(f"## {subject}\n\n")
                     for qa in qa_list:
-                        md_content += f"### {qa['question']}\n\n"
-                        md_content += f"{qa['answer']}\n\n"
-                        md_content += f"Date: {qa['timestamp']}\n\n---\n\n"
+                        buf.write(f"### {qa['question']}\n\n")
+                        buf.write(f"{qa['answer']}\n\n")
+                        buf.write(f"Date: {qa['timestamp']}\n\n---\n\n")
                 st.download_button(
                     "Download Markdown",
-                    data=md_content,
+                    data=buf.getvalue(),
                     file_name=f"my_qna_export_{st.session_state.current_user}.md",
                     mime="text/markdown"
                 )
@@ -397,13 +586,16 @@ def main_app():
         export_qa()
 
 # Create required files if they don't exist
+migrate_legacy_data()
+
 if not os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "w") as f:
-        json.dump({}, f)
+    open(DATA_FILE, "w").close()
+
+migrate_legacy_users()
 
 if not os.path.exists(USER_FILE):
     with open(USER_FILE, "w") as f:
-        yaml.dump({}, f)
+        json.dump({}, f)
 
 # Main execution
 def main():